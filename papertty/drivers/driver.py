@@ -6,6 +6,14 @@ from . import epdconfig
 EPD_WIDTH       = 128
 EPD_HEIGHT      = 250
 
+# Constant register parameters
+DRIVER_OUTPUT_CONTROL   = bytes((0xf9, 0x00, 0x00))
+DISPLAY_UPDATE_CONTROL  = bytes((0x00, 0x80))
+DISPLAY_OPTION_PARTIAL  = bytes((0x00, 0x00, 0x00, 0x00, 0x00, 0x40, 0x00, 0x00, 0x00, 0x00))
+
+# A one-byte buffer for every byte value, so single byte writes don't allocate
+SINGLE_BYTES = tuple(bytes((i,)) for i in range(256))
+
 logger = logging.getLogger(__name__)
 
 class Driver:
@@ -14,6 +22,8 @@ class Driver:
         self.dc_pin = epdconfig.DC_PIN
         self.busy_pin = epdconfig.BUSY_PIN
         self.cs_pin = epdconfig.CS_PIN
+        # lower this before init() if long wires make 20 MHz unreliable
+        self.spi_speed_hz = epdconfig.SPI_SPEED_HZ
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
 
@@ -21,7 +31,14 @@ class Driver:
         self.white = 255
         self.black = 0
 
-    lut_partial_update= [
+        # bind the GPIO/SPI functions once, they're called for every byte sent
+        self._digital_write = epdconfig.digital_write
+        self._spi_writebyte2 = epdconfig.spi_writebyte2
+
+        # solid fill frames, built on first use and shared after that
+        self.fill_buffers = {}
+
+    lut_partial_update = bytes([
         0x0,0x40,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
         0x80,0x80,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
         0x40,0x40,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
@@ -41,9 +58,9 @@ class Driver:
         0x0,0x0,0x0,0x0,0x0,0x0,0x0,
         0x22,0x22,0x22,0x22,0x22,0x22,0x0,0x0,0x0,
         0x22,0x17,0x41,0x00,0x32,0x36,
-    ]
+    ])
 
-    lut_full_update = [
+    lut_full_update = bytes([
         0x80,0x4A,0x40,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
         0x40,0x4A,0x80,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
         0x80,0x4A,0x40,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
@@ -63,7 +80,7 @@ class Driver:
         0x0,0x0,0x0,0x0,0x0,0x0,0x0,
         0x22,0x22,0x22,0x22,0x22,0x22,0x0,0x0,0x0,
         0x22,0x17,0x41,0x0,0x32,0x36,
-    ]
+    ])
 
     '''
     function :Hardware reset
@@ -71,11 +88,12 @@ class Driver:
     '''
     def reset(self):
         epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(20)
+        epdconfig.delay_ms(10)
         epdconfig.digital_write(self.reset_pin, 0)
         epdconfig.delay_ms(2)
         epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(20)
+        # the controller needs 10 ms after reset before accepting commands
+        epdconfig.delay_ms(10)
 
     '''
     function :send command
@@ -83,10 +101,11 @@ class Driver:
      command : Command register
     '''
     def send_command(self, command):
-        epdconfig.digital_write(self.dc_pin, 0)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([command])
-        epdconfig.digital_write(self.cs_pin, 1)
+        digital_write, cs_pin = self._digital_write, self.cs_pin
+        digital_write(self.dc_pin, 0)
+        digital_write(cs_pin, 0)
+        self._spi_writebyte2(SINGLE_BYTES[command])
+        digital_write(cs_pin, 1)
 
     '''
     function :send data
@@ -94,17 +113,41 @@ class Driver:
      data : Write data
     '''
     def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
+        digital_write, cs_pin = self._digital_write, self.cs_pin
+        digital_write(self.dc_pin, 1)
+        digital_write(cs_pin, 0)
+        self._spi_writebyte2(SINGLE_BYTES[data])
+        digital_write(cs_pin, 1)
 
-    # send a lot of data
+    '''
+    function :send a lot of data
+    parameter:
+     data : bytes-like buffer (bytes, bytearray or memoryview), handed to
+            spidev as-is so it never has to walk a list of ints
+    '''
     def send_data2(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte2(data)
-        epdconfig.digital_write(self.cs_pin, 1)
+        assert isinstance(data, (bytes, bytearray, memoryview)), "send_data2 expects a bytes-like buffer"
+        digital_write, cs_pin = self._digital_write, self.cs_pin
+        digital_write(self.dc_pin, 1)
+        digital_write(cs_pin, 0)
+        self._spi_writebyte2(data)
+        digital_write(cs_pin, 1)
+
+    '''
+    function :send command followed by its parameters in one CS frame
+    parameter:
+     command : Command register
+     data : Parameter bytes, sent as one burst
+    '''
+    def send_command_data(self, command, data):
+        digital_write, dc_pin, cs_pin = self._digital_write, self.dc_pin, self.cs_pin
+        digital_write(dc_pin, 0)
+        digital_write(cs_pin, 0)
+        self._spi_writebyte2(SINGLE_BYTES[command])
+        # DC is sampled per byte, so CS can stay low into the data phase
+        digital_write(dc_pin, 1)
+        self._spi_writebyte2(data)
+        digital_write(cs_pin, 1)
 
     '''
     function :Wait until the busy_pin goes LOW
@@ -112,8 +155,17 @@ class Driver:
     '''
     def ReadBusy(self):
         logger.debug("e-Paper busy")
+        polls = 0
         while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(10)
+            # most commands finish within a millisecond, only back off to
+            # the long interval when waiting for an actual refresh
+            if polls < 5:
+                epdconfig.delay_ms(0.2)
+            elif polls < 10:
+                epdconfig.delay_ms(1)
+            else:
+                epdconfig.delay_ms(10)
+            polls += 1
         logger.debug("e-Paper busy release")
 
     '''
@@ -121,8 +173,7 @@ class Driver:
     parameter:
     '''
     def TurnOnDisplay(self):
-        self.send_command(0x22) # Display Update Control
-        self.send_data(0xC7)
+        self.send_command_data(0x22, b'\xC7') # Display Update Control
         self.send_command(0x20) # Activate Display Update Sequence
         self.ReadBusy()
 
@@ -131,8 +182,7 @@ class Driver:
     parameter:
     '''
     def TurnOnDisplayPart(self):
-        self.send_command(0x22) # Display Update Control
-        self.send_data(0x0f)    # fast:0x0c, quality:0x0f, 0xcf
+        self.send_command_data(0x22, b'\x0f') # Display Update Control, fast:0x0c, quality:0x0f, 0xcf
         self.send_command(0x20) # Activate Display Update Sequence
         self.ReadBusy()
 
@@ -143,8 +193,7 @@ class Driver:
     '''
     def Lut(self, lut):
         self.send_command(0x32)
-        for i in range(0, 153):
-            self.send_data(lut[i])
+        self.send_data2(lut[0:153])
         self.ReadBusy()
 
     '''
@@ -158,10 +207,7 @@ class Driver:
         self.send_data(lut[153])
         self.send_command(0x03)     # gate voltage
         self.send_data(lut[154])
-        self.send_command(0x04)     # source voltage
-        self.send_data(lut[155])    # VSH
-        self.send_data(lut[156])    # VSH2
-        self.send_data(lut[157])    # VSL
+        self.send_command_data(0x04, lut[155:158])   # source voltage: VSH, VSH2, VSL
         self.send_command(0x2c)     # VCOM
         self.send_data(lut[158])
 
@@ -174,16 +220,13 @@ class Driver:
         yend : End position of Y-axis
     '''
     def SetWindow(self, x_start, y_start, x_end, y_end):
-        self.send_command(0x44) # SET_RAM_X_ADDRESS_START_END_POSITION
+        # SET_RAM_X_ADDRESS_START_END_POSITION
         # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data((x_start>>3) & 0xFF)
-        self.send_data((x_end>>3) & 0xFF)
+        self.send_command_data(0x44, bytes(((x_start>>3) & 0xFF, (x_end>>3) & 0xFF)))
 
-        self.send_command(0x45) # SET_RAM_Y_ADDRESS_START_END_POSITION
-        self.send_data(y_start & 0xFF)
-        self.send_data((y_start >> 8) & 0xFF)
-        self.send_data(y_end & 0xFF)
-        self.send_data((y_end >> 8) & 0xFF)
+        # SET_RAM_Y_ADDRESS_START_END_POSITION
+        self.send_command_data(0x45, bytes((y_start & 0xFF, (y_start >> 8) & 0xFF,
+                                            y_end & 0xFF, (y_end >> 8) & 0xFF)))
 
     '''
     function : Set Cursor
@@ -196,16 +239,15 @@ class Driver:
         # x point must be the multiple of 8 or the last 3 bits will be ignored
         self.send_data(x & 0xFF)
 
-        self.send_command(0x4F) # SET_RAM_Y_ADDRESS_COUNTER
-        self.send_data(y & 0xFF)
-        self.send_data((y >> 8) & 0xFF)
+        # SET_RAM_Y_ADDRESS_COUNTER
+        self.send_command_data(0x4F, bytes((y & 0xFF, (y >> 8) & 0xFF)))
 
     '''
     function : Initialize the e-Paper register
     parameter:
     '''
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(self.spi_speed_hz) != 0):
             return -1
         # EPD hardware init start
         self.reset()
@@ -214,10 +256,7 @@ class Driver:
         self.send_command(0x12)  #SWRESET
         self.ReadBusy()
 
-        self.send_command(0x01) #Driver output control
-        self.send_data(0xf9)
-        self.send_data(0x00)
-        self.send_data(0x00)
+        self.send_command_data(0x01, DRIVER_OUTPUT_CONTROL) #Driver output control
 
         self.send_command(0x11) #data entry mode
         self.send_data(0x03)
@@ -228,9 +267,7 @@ class Driver:
         self.send_command(0x3c)
         self.send_data(0x05)
 
-        self.send_command(0x21) #  Display update control
-        self.send_data(0x00)
-        self.send_data(0x80)
+        self.send_command_data(0x21, DISPLAY_UPDATE_CONTROL) #  Display update control
 
         self.send_command(0x18)
         self.send_data(0x80)
@@ -249,17 +286,20 @@ class Driver:
         img = image
         imwidth, imheight = img.size
         if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
+            if img.mode != '1':
+                img = img.convert('1')
         elif(imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
+            # image has correct dimensions, but needs to be rotated - convert
+            # first so the transpose only has to move 1-bit pixels around
+            if img.mode != '1':
+                img = img.convert('1')
+            img = img.transpose(Image.ROTATE_90)
         else:
             logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
             # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
+            return self.fill_buffer(0x00)
 
-        buf = bytearray(img.tobytes('raw'))
-        return buf
+        return img.tobytes('raw')
 
     '''
     function : Sends the image buffer in RAM to e-Paper and displays
@@ -267,15 +307,8 @@ class Driver:
         image : Image data
     '''
     def display(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])
+        self.send_data2(image)
         self.TurnOnDisplay()
 
     '''
@@ -289,23 +322,12 @@ class Driver:
         epdconfig.digital_write(self.reset_pin, 1)
 
         self.SetLut(self.lut_partial_update)
-        self.send_command(0x37)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x40)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
+        self.send_command_data(0x37, DISPLAY_OPTION_PARTIAL)
 
         self.send_command(0x3C) #BorderWavefrom
         self.send_data(0x80)
 
-        self.send_command(0x22)
-        self.send_data(0xC0)
+        self.send_command_data(0x22, b'\xC0')
         self.send_command(0x20)
         self.ReadBusy()
 
@@ -325,11 +347,10 @@ class Driver:
         image : Image data
     '''
     def displayPartBaseImage(self, image):
-        self.send_command(0x24)
-        self.send_data2(image)
-
-        self.send_command(0x26)
-        self.send_data2(image)
+        # the controller can't copy one RAM into the other, so the same
+        # buffer goes to both the new (0x24) and the old (0x26) image RAM
+        self.send_command_data(0x24, image)
+        self.send_command_data(0x26, image)
         self.TurnOnDisplay()
 
     '''
@@ -337,16 +358,26 @@ class Driver:
     parameter:
     '''
     def Clear(self, color=0xFF):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-        # logger.debug(linewidth)
-
         self.send_command(0x24)
-        self.send_data2([color] * int(self.height * linewidth))
+        self.send_data2(self.fill_buffer(color))
         self.TurnOnDisplay()
 
+    '''
+    function : Frame buffer filled with a single byte value
+    parameter:
+        color : fill byte
+    '''
+    def fill_buffer(self, color):
+        buf = self.fill_buffers.get(color)
+        if buf is None:
+            if self.width%8 == 0:
+                linewidth = int(self.width/8)
+            else:
+                linewidth = int(self.width/8) + 1
+            # bytes are immutable, so the same frame can be handed out every time
+            buf = self.fill_buffers[color] = bytes((color,)) * int(self.height * linewidth)
+        return buf
+
     '''
     function : Enter sleep mode
     parameter:
@@ -359,23 +390,16 @@ class Driver:
         epdconfig.module_exit()
 
     def set_memory_area(self, x_start, y_start, x_end, y_end):
-        self.send_command(0x44)
         # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data((x_start >> 3) & 0xFF)
-        self.send_data((x_end >> 3) & 0xFF)
-        self.send_command(0x45)
-        self.send_data(y_start & 0xFF)
-        self.send_data((y_start >> 8) & 0xFF)
-        self.send_data(y_end & 0xFF)
-        self.send_data((y_end >> 8) & 0xFF)
+        self.send_command_data(0x44, bytes(((x_start >> 3) & 0xFF, (x_end >> 3) & 0xFF)))
+        self.send_command_data(0x45, bytes((y_start & 0xFF, (y_start >> 8) & 0xFF,
+                                            y_end & 0xFF, (y_end >> 8) & 0xFF)))
 
     def set_memory_pointer(self, x, y):
         self.send_command(0x4E)
         # x point must be the multiple of 8 or the last 3 bits will be ignored
         self.send_data((x >> 3) & 0xFF)
-        self.send_command(0x4F)
-        self.send_data(y & 0xFF)
-        self.send_data((y >> 8) & 0xFF)
+        self.send_command_data(0x4F, bytes((y & 0xFF, (y >> 8) & 0xFF)))
         self.ReadBusy()
 
     '''
@@ -385,41 +409,47 @@ class Driver:
         x  : X-axis starting position
         y  : Y-axis starting position
     '''
-    def set_frame_memory(self, image, x, y):
+    def set_frame_memory(self, image, x, y, box=None):
         if image is None or x < 0 or y < 0:
             return
-        image_monocolor = image.convert('1')
-        image_width, image_height = image_monocolor.size
+        image_monocolor = image if image.mode == '1' else image.convert('1')
+        # optionally write only the box of a larger image
+        left, top, right, bottom = box or (0, 0) + image_monocolor.size
+        x, y, x_end, y_end = self.frame_memory_window(x, y, right - left, bottom - top)
+        if x_end < x or y_end < y:
+            # nothing of the image is on the panel
+            return
+        # send the image data - mode '1' images are already packed 8 pixels
+        # per byte (MSB first), so just cut out the area being written
+        area = (left, top, left + x_end - x + 1, top + y_end - y + 1)
+        if area != (0, 0) + image_monocolor.size:
+            image_monocolor = image_monocolor.crop(area)
+        self.write_frame_memory(image_monocolor.tobytes('raw'), x, y, x_end, y_end)
+
+    def frame_memory_window(self, x, y, width, height):
+        """Return the frame memory window (x, y, x_end, y_end) that an area of
+           width x height pixels at x, y is written to, clipped to the panel"""
         # x point must be the multiple of 8 or the last 3 bits will be ignored
         x = x & 0xF8
-        image_width = image_width & 0xF8
-        if x + image_width >= self.width:
+        width = width & 0xF8
+        if x + width >= self.width:
             x_end = self.width - 1
         else:
-            x_end = x + image_width - 1
-        if y + image_height >= self.height:
+            x_end = x + width - 1
+        if y + height >= self.height:
             y_end = self.height - 1
         else:
-            y_end = y + image_height - 1
+            y_end = y + height - 1
+        return x, y, x_end, y_end
+
+    def write_frame_memory(self, data, x, y, x_end, y_end):
         self.set_memory_area(x, y, x_end, y_end)
         self.set_memory_pointer(x, y)
         self.send_command(0x24)
-        # send the image data
-        pixels = image_monocolor.load()
-        byte_to_send = 0x00
-        for j in range(0, y_end - y + 1):
-            # 1 byte = 8 pixels, steps of i = 8
-            for i in range(0, x_end - x + 1):
-                # Set the bits for the column of pixels at the current position.
-                if pixels[i, j] != 0:
-                    byte_to_send |= 0x80 >> (i % 8)
-                if i % 8 == 7:
-                    self.send_data(byte_to_send)
-                    byte_to_send = 0x00
+        self.send_data2(data)
 
     def display_frame(self):
-        self.send_command(0x22)
-        self.send_data(0xC4)
+        self.send_command_data(0x22, b'\xC4')
         self.send_command(0x20)
         self.send_command(0xFF)
 
@@ -434,9 +464,22 @@ class Driver:
             self.set_frame_memory(image, x, y)
             self.display_frame()
 
+    def draw_regions(self, image, boxes):
+        """Replace the areas under the boxes on the display with the same areas
+           of a full screen image, and show them all with a single refresh"""
+        for box in boxes:
+            self.set_frame_memory(image, box[0], box[1], box)
+        self.display_frame()
+        if self.partial_refresh:
+            # set the memory again if partial refresh LUT is used
+            for box in boxes:
+                self.set_frame_memory(image, box[0], box[1], box)
+            self.display_frame()
+
     def clear(self):
         """Clears the display"""
-        image = Image.new('1', (self.height, self.width), self.black)
-        self.draw(0, 0, image)
-        image = Image.new('1', (self.height, self.width), self.white)
-        self.draw(0, 0, image)
+        # draw() may have left a smaller RAM window behind
+        self.set_memory_area(0, 0, self.width - 1, self.height - 1)
+        self.set_memory_pointer(0, 0)
+        self.Clear(self.black)
+        self.Clear(self.white)
@@ -13,6 +13,9 @@ class RaspberryPi:
     BUSY_PIN = 24
     PWR_PIN  = 18
 
+    # SPI clock, the SSD1680 accepts writes at up to 20 MHz
+    SPI_SPEED_HZ = 20000000
+
     def __init__(self):
         import spidev
         import RPi.GPIO
@@ -35,7 +38,7 @@ class RaspberryPi:
     def spi_writebyte2(self, data):
         self.SPI.writebytes2(data)
 
-    def module_init(self):
+    def module_init(self, speed_hz=None):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
         self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
@@ -48,7 +51,7 @@ class RaspberryPi:
 
         # SPI device, bus = 0, device = 0
         self.SPI.open(0, 0)
-        self.SPI.max_speed_hz = 4000000
+        self.SPI.max_speed_hz = speed_hz or self.SPI_SPEED_HZ
         self.SPI.mode = 0b00
         return 0
 
@@ -13,6 +13,7 @@
 
 import fcntl
 import os
+import select
 import signal
 import struct
 import sys
@@ -26,6 +27,18 @@ from .drivers.driver import Driver
 # resource path
 RESOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources")
 
+# a glyph with a flat top and bottom that Pillow puts in the same place on its
+# own as in a line, used to find the cell of a glyph rendered after it
+GLYPH_RULER = 'H'
+# glyphs that reach from the top to the bottom of a line, drawn along so a single
+# character doesn't get clipped by a bitmap sized after the string
+GLYPH_CONTEXT = 'Éjg|'
+
+# some kernels fill blank vcsu cells with four space bytes instead of an
+# UTF-32 space, which would decode as an invalid character
+VCSU_BLANK = b'\x20\x20\x20\x20'
+VCSU_SPACE = b'\x20\x00\x00\x00'
+
 class PaperTTY:
     """The main class - handles various settings and showing text on the display"""
     defaultfont = os.path.join(RESOURCE_PATH, "Andale_Mono.ttf")
@@ -45,6 +58,12 @@ class PaperTTY:
     cols = None
     is_truetype = None
     fontfile = None
+    monospace = None
+    glyph_cache = None
+    glyph_masks = None
+    frames = None
+    col_x = None
+    row_y = None
 
     def __init__(self, font=defaultfont, fontsize=defaultsize, partial=None, encoding='utf-8', spacing=0, cursor=None):
         """Create a PaperTTY with the chosen driver and settings"""
@@ -57,6 +76,7 @@ class PaperTTY:
         self.black = self.driver.black
         self.encoding = encoding
         self.cursor = cursor
+        self.frames = {}
 
     def ready(self):
         """Check that the driver is loaded and initialized"""
@@ -91,10 +111,113 @@ class PaperTTY:
         """Split a sequence into parts of size n"""
         return [s[begin:begin + n] for begin in range(0, len(s), n)]
 
+    @staticmethod
+    def join_rows(buff, n, separator):
+        """Return the rows of n bytes in a buffer joined and terminated with a
+           separator, without copying the rows on the way"""
+        view = memoryview(buff)
+        return separator.join([view[begin:begin + n] for begin in range(0, len(view), n)]) + separator
+
+    @staticmethod
+    def vcs_text(buff, cols, character_width, encoding):
+        """Return the text of a vcs(u) buffer with a newline after each row of cols
+           characters, character_width bytes each"""
+        if character_width == 4:
+            # work around weird bug, a single pass that returns buff
+            # itself when there is nothing to fix
+            buff = buff.replace(VCSU_BLANK, VCSU_SPACE)
+        # encoded without the byte order mark utf_32 starts with
+        newline = '\n'.encode(encoding)[-character_width:]
+        return PaperTTY.join_rows(buff, cols * character_width, newline).decode(encoding, 'replace')
+
+    @staticmethod
+    def equal_rows(raw1, raw2, stride, rows, tail=False):
+        """Return the number of leading (or trailing) rows that are identical in two
+           raw image buffers, found by bisecting with byte slice comparisons"""
+        lo, hi = 0, rows
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            span = mid * stride
+            if (raw1[-span:] == raw2[-span:]) if tail else (raw1[:span] == raw2[:span]):
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
     @staticmethod
     def img_diff(img1, img2):
         """Return the bounding box of differences between two images"""
-        return ImageChops.difference(img1, img2).getbbox()
+        boxes = PaperTTY.img_diff_bands(img1, img2, limit=1)
+        return boxes[0] if boxes else None
+
+    @staticmethod
+    def img_diff_bands(img1, img2, limit=4):
+        """Return the bounding boxes of the bands of rows that differ between two
+           images, merging the bands closest to each other down to limit boxes"""
+        if not (img1.mode == img2.mode == '1' and img1.size == img2.size):
+            bbox = ImageChops.difference(img1, img2).getbbox()
+            return [bbox] if bbox else []
+        # one byte per pixel, cheaper to get than the packed bits
+        raw1, raw2 = img1.tobytes('raw', 'L'), img2.tobytes('raw', 'L')
+        if raw1 == raw2:
+            return []
+        width, height = img1.size
+        top = PaperTTY.equal_rows(raw1, raw2, width, height)
+        bottom = height - PaperTTY.equal_rows(raw1, raw2, width, height, tail=True)
+        bands = [(0, top, width, bottom)]
+        if limit > 1:
+            # split into runs of changed rows
+            bands = []
+            start = None
+            for y in range(top, bottom):
+                offset = y * width
+                if raw1[offset:offset + width] != raw2[offset:offset + width]:
+                    if start is None:
+                        start = y
+                elif start is not None:
+                    bands.append((0, start, width, y))
+                    start = None
+            bands.append((0, start, width, bottom))
+            bands = PaperTTY.merge_boxes(bands, limit)
+        boxes = []
+        for _, y0, _, y1 in bands:
+            # only the rows that changed need a pixel by pixel comparison
+            box = (0, y0, width, y1)
+            x0, _, x1, _ = ImageChops.difference(img1.crop(box), img2.crop(box)).getbbox()
+            boxes.append((x0, y0, x1, y1))
+        return boxes
+
+    @staticmethod
+    def merge_boxes(boxes, limit=4):
+        """Join bounding boxes into at most limit boxes covering separate bands of rows,
+           the bands closest to each other are joined first"""
+        merged = []
+        for box in sorted(boxes, key=lambda bb: bb[1]):
+            if merged and box[1] <= merged[-1][3]:
+                last = merged[-1]
+                merged[-1] = (min(last[0], box[0]), last[1], max(last[2], box[2]), max(last[3], box[3]))
+            else:
+                merged.append(tuple(box))
+        while len(merged) > limit:
+            # join the two bands with the least rows between them
+            i = min(range(len(merged) - 1), key=lambda i: merged[i + 1][1] - merged[i][3])
+            first, second = merged[i], merged[i + 1]
+            merged[i:i + 2] = [(min(first[0], second[0]), first[1], max(first[2], second[2]), second[3])]
+        return merged
+
+    @staticmethod
+    def changed_cells(lines, oldlines):
+        """Return the (row, column) positions of characters that differ between two
+           lists of lines, or None if the text doesn't have the same shape"""
+        if len(lines) != len(oldlines):
+            return None
+        changed = []
+        for row, (line, oldline) in enumerate(zip(lines, oldlines)):
+            if line != oldline:
+                if len(line) != len(oldline):
+                    return None
+                changed.extend((row, col) for col, (a, b) in enumerate(zip(line, oldline)) if a != b)
+        return changed
 
     @staticmethod
     def ttydev(vcsa):
@@ -171,15 +294,22 @@ class PaperTTY:
             font = ImageFont.load_default()
 
         if font:
+            if font is not self.font:
+                # get physical dimensions of font. Newer Pillow versions (8.0+)
+                # can give the advance of a single M, otherwise take the average
+                # width of 1000 M's because oblique fonts a complicated. Only a
+                # new font changes it, so it isn't measured again on every
+                # recalculation.
+                if hasattr(font, 'getlength'):
+                    self.font_width = int(font.getlength('M'))
+                else:
+                    self.font_width = font.getsize('M' * 1000)[0] // 1000
             self.recalculate_font(font)
 
         return font
 
     def recalculate_font(self, font):
         """Load the PIL or TrueType font"""
-        # get physical dimensions of font. Take the average width of
-        # 1000 M's because oblique fonts a complicated.
-        self.font_width = font.getsize('M' * 1000)[0] // 1000
         if 'getmetrics' in dir(font):
             metrics_ascent, metrics_descent = font.getmetrics()
             self.spacing = int(self.spacing) if self.spacing != 'auto' else (metrics_descent - 2)
@@ -194,6 +324,78 @@ class PaperTTY:
             # pil fonts don't seem to have metrics, but all
             # characters seem to have the same height
             self.font_height = font.getsize('a')[1] + self.spacing
+        # cached character tiles can only stand in for draw.text if every
+        # glyph advances by exactly one font width, and not for bitmap fonts
+        # that paste each glyph's whole box over the glyph before it
+        base = font.getsize('M')[0]
+        self.monospace = isinstance(font, ImageFont.FreeTypeFont) and all(
+            font.getsize(c + 'M')[0] - base == self.font_width for c in 'iW. ')
+        # tiles depend on the font and its metrics, so start over
+        self.glyph_cache = {}
+        self.glyph_masks = {}
+        # pixel positions of the columns and rows that fit on the display either
+        # way round, plus a column for glyphs spilling back onto it
+        longest = max(self.driver.width, self.driver.height)
+        self.col_x = tuple(range(0, longest + self.font_width, self.font_width))
+        self.row_y = tuple(range(0, longest, self.font_height))
+
+    def glyph_mask(self, char, rotate=False):
+        """Return a cached mask of a character, three cells wide and two rows tall
+           with the glyph drawn in the middle cell of the top row, optionally
+           rotated by 90 degrees for landscape"""
+        mask = self.glyph_masks.get((char, rotate))
+        if mask is None and rotate:
+            mask = self.glyph_masks[(char, rotate)] = self.glyph_mask(char).transpose(Image.ROTATE_90)
+        elif mask is None:
+            width, height = self.font_width, self.font_height
+            # Pillow moves a whole string around depending on the glyphs in it,
+            # but the glyphs keep their places relative to each other. Render the
+            # glyph after the ruler and cut it out where the cell is when the
+            # ruler is drawn on its own at the cell origin.
+            text = GLYPH_RULER + '  ' + char + '  ' + GLYPH_CONTEXT
+            scratch = Image.new('1', (width * len(text), height * 4), 0)
+            ImageDraw.Draw(scratch).text((0, height), text, font=self.font, fill=255)
+            ruler = Image.new('1', (width, height * 2), 0)
+            ImageDraw.Draw(ruler).text((0, 0), GLYPH_RULER, font=self.font, fill=255)
+            x0, y0 = scratch.crop((0, 0, width, height * 4)).getbbox()[:2]
+            x1, y1 = ruler.getbbox()[:2]
+            x, y = x0 - x1 + width * 2, y0 - y1
+            mask = self.glyph_masks[(char, rotate)] = scratch.crop((x, y, x + width * 3, y + height * 2))
+        return mask
+
+    def glyph(self, char, fill, rotate=False):
+        """Return a cached character cell sized tile with the glyph rendered on it,
+           optionally rotated by 90 degrees for landscape, or None if the glyph
+           doesn't fit in a character cell"""
+        key = (char, fill, rotate)
+        tile = self.glyph_cache.get(key, False)
+        if tile is False and rotate:
+            tile = self.glyph(char, fill)
+            tile = self.glyph_cache[key] = tile and tile.transpose(Image.ROTATE_90)
+        elif tile is False:
+            width, height = self.font_width, self.font_height
+            cell = (width, 0, width * 2, height)
+            mask = self.glyph_mask(char)
+            outside = mask.copy()
+            outside.paste(0, cell)
+            if outside.getbbox():
+                # spills over its neighbours, has to be drawn with the mask
+                tile = None
+            else:
+                tile = Image.new('1', (width, height), self.white)
+                tile.paste(fill, (0, 0), mask.crop(cell))
+            self.glyph_cache[key] = tile
+        return tile
+
+    def blank_frame(self, size, oldimage=None):
+        """Return a blank image of the given size, reusing one of the two buffers
+           kept for each size - the one that isn't the previously shown image"""
+        frames = self.frames.get(size)
+        if frames is None:
+            frames = self.frames[size] = (Image.new('1', size, self.white), Image.new('1', size, self.white))
+        image = frames[1] if frames[0] is oldimage else frames[0]
+        image.paste(self.white, (0, 0) + size)
+        return image
 
     def init_display(self):
         """Initialize the display - call the driver's init method"""
@@ -209,11 +411,14 @@ class PaperTTY:
         ph = self.driver.height
         return int((pw if portrait else ph) / width), int((ph if portrait else pw) / height)
 
-    def draw_line_cursor(self, cursor, draw):
+    def rotate_box(self, box):
+        """Return where a box on the unrotated landscape text lands on the display"""
+        x0, y0, x1, y1 = box
+        return y0, self.driver.height - x1, y1, self.driver.height - x0
+
+    def draw_line_cursor(self, cursor, image, rotated=False):
         cur_x, cur_y = cursor[0], cursor[1]
         width = self.font_width
-        # desired cursor width
-        cur_width = width - 1
         # get font height
         height = self.font_height
         # starting X is the font width times current column
@@ -223,47 +428,84 @@ class PaperTTY:
             offset = int(self.cursor)
         # add 1 because rows start at 0 and we want the cursor at the bottom
         start_y = (cur_y + 1) * height - 1 - offset
-        # draw the cursor line
-        draw.line((start_x, start_y, start_x + cur_width, start_y), fill=self.black)
+        # fill a one pixel tall box across the cell, no line drawing needed
+        box = (start_x, start_y, start_x + width, start_y + 1)
+        if rotated:
+            box = self.rotate_box(box)
+        image.paste(self.black, box)
 
-    def draw_block_cursor(self, cursor, image):
+    def draw_block_cursor(self, cursor, image, rotated=False):
         cur_x, cur_y = cursor[0], cursor[1]
         width = self.font_width
         # get font height
         height = self.font_height
-        upper_left = (cur_x * width, cur_y * height)
-        lower_right = ((cur_x + 1) * width, (cur_y + 1) * height)
-        mask = Image.new('1', (image.width, image.height), self.black)
-        draw = ImageDraw.Draw(mask)
-        draw.rectangle([upper_left, lower_right], fill=self.white)
-        return ImageChops.logical_xor(image, mask)
+        box = (cur_x * width, cur_y * height, (cur_x + 1) * width, (cur_y + 1) * height)
+        if rotated:
+            box = self.rotate_box(box)
+        # invert just the cell under the cursor
+        image.paste(ImageChops.invert(image.crop(box)), box[:2])
+        return image
 
     def showtext(self, text, fill, cursor=None, portrait=False, flipx=False, flipy=False, oldimage=None):
-        """Draw a string on the screen"""
+        """Draw a string on the screen. The returned image is drawn over by later
+           calls unless it's passed back to them as oldimage."""
         if self.ready():
+            # look these up once, the loops below run for every character
+            font_width, font_height = self.font_width, self.font_height
+            driver_width, driver_height = self.driver.width, self.driver.height
+            # monospace text is pasted straight onto the display orientation,
+            # other fonts are drawn as landscape and rotated afterwards
+            rotated = self.monospace and not portrait
             # set order of h, w according to orientation
-            image = Image.new('1', (self.driver.width, self.driver.height) if portrait else (
-                self.driver.height, self.driver.width),
-                              self.white)
+            image = self.blank_frame((driver_width, driver_height) if portrait or rotated else (
+                driver_height, driver_width), oldimage)
             # create the Draw object and draw the text
             draw = ImageDraw.Draw(image)
 
             # Split the text up by line and display each line individually.
             # This is a workaround for a font height bug in PIL
             lines = text.split('\n')
-            for i, line in enumerate(lines):
-                if line:
-                    y = i * self.font_height
-                    draw.text((0, y), line, font=self.font, fill=fill, spacing=self.spacing)
+            if self.monospace:
+                # paste the cached glyph tiles cell by cell, glyphs too big for
+                # a cell are drawn last so they can spill over their neighbours
+                width = driver_height if rotated else driver_width
+                paste = image.paste
+                glyph = self.glyph
+                tiles = self.glyph_cache
+                col_x = self.col_x
+                overflow = []
+                # characters past the display edge are left out
+                for y, line in zip(self.row_y, lines):
+                    for x, char in zip(col_x, line):
+                        if char == ' ':
+                            continue
+                        # go through glyph only for tiles not rendered yet
+                        tile = tiles.get((char, fill, rotated), False)
+                        if tile is False:
+                            tile = glyph(char, fill, rotated)
+                        if tile is not None:
+                            # the text runs from top to bottom when rotated
+                            paste(tile, (y, width - x - font_width) if rotated else (x, y))
+                        else:
+                            overflow.append((x - font_width, y, char))
+                for x, y, char in overflow:
+                    paste(fill, (y, width - x - 3 * font_width) if rotated else (x, y),
+                          self.glyph_mask(char, rotated))
+            else:
+                font, spacing = self.font, self.spacing
+                for i, line in enumerate(lines):
+                    if line:
+                        y = i * font_height
+                        draw.text((0, y), line, font=font, fill=fill, spacing=spacing)
 
             # if we want a cursor, draw it - the most convoluted part
             if cursor and self.cursor:
                 if self.cursor == 'block':
-                    image = self.draw_block_cursor(cursor, image)
+                    image = self.draw_block_cursor(cursor, image, rotated)
                 else:
-                    self.draw_line_cursor(cursor, draw)
+                    self.draw_line_cursor(cursor, image, rotated)
             # rotate image if using landscape
-            if not portrait:
+            if not portrait and not rotated:
                 image = image.rotate(90, expand=True)
             # apply flips if desired
             if flipx:
@@ -272,12 +514,12 @@ class PaperTTY:
                 image = image.transpose(Image.FLIP_TOP_BOTTOM)
             # find out which part changed and draw only that on the display
             if oldimage and self.partial:
-                # create a bounding box of the altered region and
+                # create bounding boxes of the altered bands of rows and
                 # make the X coordinates divisible by 8
-                diff_bbox = self.band(self.img_diff(image, oldimage))
-                # crop the altered region and draw it on the display
-                if diff_bbox:
-                    self.driver.draw(diff_bbox[0], diff_bbox[1], image.crop(diff_bbox))
+                diff_bboxes = [self.band(bb) for bb in self.img_diff_bands(image, oldimage)]
+                # draw the altered regions on the display at once
+                if diff_bboxes:
+                    self.driver.draw_regions(image, diff_bboxes)
             else:
                 # if no previous image, draw the entire display
                 self.driver.draw(0, 0, image)
@@ -285,6 +527,75 @@ class PaperTTY:
         else:
             self.error("Display not ready")
 
+    def update_cells(self, image, lines, changed, fill, cursor=None, oldcursor=None, portrait=False,
+                     flipx=False, flipy=False, oldlines=None):
+        """Redraw the changed (row, column) character cells of a previously shown image
+           in place and update the display. Returns the image, or None if the cells
+           can't be redrawn on their own and the whole text has to be drawn again."""
+        if not self.ready():
+            self.error("Display not ready")
+        if not self.monospace or flipx or flipy:
+            return None
+        if image.size != (self.driver.width, self.driver.height):
+            return None
+        width, height = self.font_width, self.font_height
+
+        def char_at(text, row, col):
+            if 0 <= row < len(text) and 0 <= col < len(text[row]):
+                return text[row][col]
+            return ' '
+
+        cells = set(changed)
+        cursor_cell = None
+        if self.cursor:
+            if cursor:
+                cursor_cell = (cursor[1], cursor[0])
+                cells.add(cursor_cell)
+            if oldcursor:
+                cells.add((oldcursor[1], oldcursor[0]))
+            # an underline cursor lifted out of its cell would need its neighbours redrawn
+            if self.cursor not in ('block', 'default') and not 0 <= int(self.cursor) < height:
+                return None
+        # glyphs spilling over their cell reach one cell to the sides and one row down
+        for row, col in cells:
+            for text in (lines, oldlines or lines):
+                for r in (row - 1, row):
+                    for c in (col - 1, col, col + 1):
+                        char = char_at(text, r, c)
+                        if char != ' ' and self.glyph(char, fill) is None:
+                            return None
+
+        boxes = []
+        for row, col in cells:
+            if row >= len(self.row_y) or col >= len(self.col_x):
+                # off the display
+                continue
+            cell = self.glyph(char_at(lines, row, col), fill, not portrait)
+            x, y = self.col_x[col], self.row_y[row]
+            box = (x, y, x + width, y + height)
+            if not portrait:
+                box = self.rotate_box(box)
+            image.paste(cell, box[:2])
+            # cells at the edges may be only partly on the display
+            box = (max(box[0], 0), max(box[1], 0), min(box[2], image.width), min(box[3], image.height))
+            if box[0] < box[2] and box[1] < box[3]:
+                boxes.append(box)
+        if cursor_cell is not None:
+            if self.cursor == 'block':
+                self.draw_block_cursor(cursor, image, not portrait)
+            else:
+                self.draw_line_cursor(cursor, image, not portrait)
+
+        if self.partial:
+            # make the X coordinates divisible by 8 and draw the cells on the display
+            boxes = [self.band(bb) for bb in self.merge_boxes(boxes)]
+            # nothing on the display changed, don't refresh it for nothing
+            if boxes:
+                self.driver.draw_regions(image, boxes)
+        else:
+            self.driver.draw(0, 0, image)
+        return image
+
     def clear(self):
         """Clears the display; set all black, then all white, or use INIT mode, if driver supports it."""
         if self.ready():
@@ -313,7 +624,7 @@ class Settings:
 @click.option('--noclear', default=False, is_flag=True, help='Leave display content on exit')
 @click.option('--nocursor', default=False, is_flag=True, help="(DEPRECATED, use --cursor=none instead) Don't draw the cursor")
 @click.option('--cursor', default='legacy', help='Set cursor type. Valid values are default (underscore cursor at a sensible place), block (inverts colors at cursor), none (draws no cursor) or a number n (underscore cursor n pixels from the bottom)', show_default=False)
-@click.option('--sleep', default=0.1, help='Minimum sleep between refreshes', show_default=True)
+@click.option('--sleep', default=0.1, help='Seconds between update checks until the console signals changes, and to back off after console errors', show_default=True)
 @click.option('--rows', 'ttyrows', default=12, help='Set TTY rows')
 @click.option('--cols', 'ttycols', default=45, help='Set TTY columns')
 @click.option('--portrait', default=False, is_flag=True, help='Use portrait orientation', show_default=False)
@@ -350,6 +661,8 @@ def terminal(vcsa, font, fontsize, noclear, nocursor, cursor, sleep, ttyrows, tt
     oldbuff = ''
     oldimage = None
     oldcursor = None
+    oldraw = None
+    oldattributes = None
     # dirty - should refactor to make this cleaner
     flags = {'scrub_requested': False, 'show_menu': False, 'clear': False}
 
@@ -377,37 +690,67 @@ def terminal(vcsa, font, fontsize, noclear, nocursor, cursor, sleep, ttyrows, tt
         if all([ttyrows, ttycols]):
             ptty.set_tty_size(ptty.ttydev(vcsa), ttyrows, ttycols)
 
-        print("Started displaying {}, minimum update interval {} s, exit with Ctrl-C".format(vcsa, sleep))
+        print("Started displaying {}, checking for updates every {} s until the console signals changes, exit with Ctrl-C".format(vcsa, sleep))
         character_width, vcsudev = ptty.vcsudev(vcsa)
-        while True:
-            with open(vcsa, 'rb') as f:
-                with open(vcsudev, 'rb') as vcsu:
-                    # read the first 4 bytes to get the console attributes
-                    attributes = f.read(4)
-                    rows, cols, x, y = list(map(ord, struct.unpack('cccc', attributes)))
-
-                    # read from the text buffer
-                    buff = vcsu.read()
-                    if character_width == 4:
-                        # work around weird bug
-                        buff = buff.replace(b'\x20\x20\x20\x20', b'\x20\x00\x00\x00')
+        # bytes.decode goes straight to the C codec for these, no lookup needed
+        encoding = 'utf_32' if character_width == 4 else ptty.encoding
+        # keep the devices open and read them from the start on every update check,
+        # pread needs no seeking and no buffered file objects
+        vcsa_fd = os.open(vcsa, os.O_RDONLY)
+        vcsu_fd = os.open(vcsudev, os.O_RDONLY)
+        try:
+            # the console signals changes to its contents with POLLPRI on vcsa
+            updates = select.poll()
+            updates.register(vcsa_fd, select.POLLPRI)
+            # don't trust the device to wake us up until it has done so once
+            signalled = False
+            while True:
+                # read the first 4 bytes to get the console attributes
+                attributes = os.pread(vcsa_fd, 4, 0)
+                rows, cols, x, y = attributes
+
+                # read from the text buffer
+                raw = os.pread(vcsu_fd, rows * cols * character_width, 0)
+                # decode only if the console doesn't read exactly as last time,
+                # otherwise buff and cursor are still the same as before
+                if raw != oldraw or attributes != oldattributes:
+                    oldraw, oldattributes = raw, attributes
                     # find character under cursor (in case using a non-fixed width font)
-                    char_under_cursor = buff[character_width * (y * rows + x):character_width * (y * rows + x + 1)]
-                    encoding = 'utf_32' if character_width == 4 else ptty.encoding
+                    char_under_cursor = raw[character_width * (y * rows + x):character_width * (y * rows + x + 1)]
                     cursor = (x, y, char_under_cursor.decode(encoding, 'ignore'))
                     # add newlines per column count
-                    buff = ''.join([r.decode(encoding, 'replace') + '\n' for r in ptty.split(buff, cols * character_width)])
-                    # do something only if content has changed or cursor was moved
-                    if buff != oldbuff or cursor != oldcursor:
-                        # show new content
-                        oldimage = ptty.showtext(buff, fill=ptty.black, cursor=cursor if not nocursor else None,
-                                                oldimage=oldimage,
-                                                **textargs)
-                        oldbuff = buff
-                        oldcursor = cursor
-                    else:
-                        # delay before next update check
+                    buff = ptty.vcs_text(raw, cols, character_width, encoding)
+                # do something only if content has changed or cursor was moved
+                if buff != oldbuff or cursor != oldcursor:
+                    # redraw only the characters that changed if possible
+                    image = None
+                    if oldimage:
+                        lines, oldlines = buff.split('\n'), oldbuff.split('\n')
+                        changed = ptty.changed_cells(lines, oldlines)
+                        if changed is not None:
+                            image = ptty.update_cells(oldimage, lines, changed, ptty.black,
+                                                      cursor=cursor if not nocursor else None,
+                                                      oldcursor=oldcursor if not nocursor else None,
+                                                      oldlines=oldlines, **textargs)
+                    # otherwise show new content
+                    if image is None:
+                        image = ptty.showtext(buff, fill=ptty.black, cursor=cursor if not nocursor else None,
+                                              oldimage=oldimage,
+                                              **textargs)
+                    oldimage = image
+                    oldbuff = buff
+                    oldcursor = cursor
+                else:
+                    # wait for a change, or delay before next update check
+                    events = updates.poll(None if signalled else float(sleep) * 1000)
+                    if any(event & select.POLLPRI for _, event in events):
+                        signalled = True
+                    elif events:
+                        # console gone or in error, don't spin on it
                         time.sleep(float(sleep))
+        finally:
+            os.close(vcsa_fd)
+            os.close(vcsu_fd)
 
 if __name__ == '__main__':
     terminal()